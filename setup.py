@@ -0,0 +1,21 @@
+"""Build the optional Cython interpreter loop.
+
+    python setup.py build_ext --inplace
+
+Without Cython the package installs as pure Python.
+"""
+
+from setuptools import setup
+
+try:
+    from Cython.Build import cythonize
+except ImportError:  # pragma: no cover - optional dependency
+    ext_modules = []
+else:
+    ext_modules = cythonize("uvm/_fastvm.pyx")
+
+setup(
+    name="uvm",
+    packages=["uvm"],
+    ext_modules=ext_modules,
+)
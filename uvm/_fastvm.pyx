@@ -0,0 +1,81 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+"""Optional C implementation of the interpreter loop.
+
+Build with ``python setup.py build_ext --inplace``. ``Interpreter.run``
+prefers this extension since it costs nothing to load; without it, long
+runs use the Numba kernel and everything else the pure Python loop.
+"""
+
+from libc.stdint cimport int64_t, uint64_t
+
+
+def run(
+    const int64_t[::1] opcodes,
+    const int64_t[::1] bs,
+    const int64_t[::1] cs,
+    const int64_t[::1] ds,
+    uint64_t[::1] mem,
+    Py_ssize_t pc,
+    Py_ssize_t stop,
+):
+    """Execute instructions ``pc:stop`` against ``mem`` and return the new pc.
+
+    Same contract as ``uvm._jit.run_vm``: the program comes as the four
+    ``Program`` columns and ``mem`` is the dense ``array('Q')`` of a
+    ``Memory``, already reserved up to the highest destination address.
+    Reads past its end yield zero.
+    """
+
+    cdef Py_ssize_t size = mem.shape[0]
+    cdef int64_t opcode, b, c
+    cdef uint64_t base, address, value
+    with nogil:
+        while pc < stop:
+            opcode = opcodes[pc]
+            b = bs[pc]
+            c = cs[pc]
+            if opcode == 17:  # LOAD_CONST
+                mem[c] = <uint64_t>b
+            elif opcode == 23:  # WRITE_MEM
+                mem[c] = mem[b] if b < size else 0
+            else:  # READ_MEM (16) / NOT_MEM (24)
+                base = mem[b] if b < size else 0
+                value = 0
+                if base < <uint64_t>size:
+                    address = base + <uint64_t>c
+                    if address < <uint64_t>size:
+                        value = mem[address]
+                if opcode == 24:
+                    value = ~value
+                mem[ds[pc]] = value
+            pc += 1
+    return pc
+
+
+def highest_destination(
+    const int64_t[::1] opcodes,
+    const int64_t[::1] cs,
+    const int64_t[::1] ds,
+    int64_t limit,
+):
+    """Return the highest address the program writes, ``-1`` if it writes none.
+
+    Returns ``limit`` as soon as an opcode without a known destination turns
+    up, like ``uvm.interpreter._highest_destination``.
+    """
+
+    cdef Py_ssize_t pc
+    cdef int64_t opcode, highest = -1
+    with nogil:
+        for pc in range(opcodes.shape[0]):
+            opcode = opcodes[pc]
+            if opcode == 17 or opcode == 23:  # LOAD_CONST / WRITE_MEM
+                if cs[pc] > highest:
+                    highest = cs[pc]
+            elif opcode == 16 or opcode == 24:  # READ_MEM / NOT_MEM
+                if ds[pc] > highest:
+                    highest = ds[pc]
+            else:
+                highest = limit
+                break
+    return highest
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+"""Optional Numba-compiled execution loop for the training VM.
+
+The interpreter imports this module only for long runs, since loading Numba
+takes longer than a short program runs. ``run`` and ``run_vm`` are ``None``
+when NumPy or Numba is not installed.
+"""
+
+try:
+    import numpy as np
+    from numba import njit
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+    run = None
+    run_vm = None
+else:
+
+    @njit(cache=True)
+    def run_vm(opcodes, bs, cs, ds, mem, pc, stop):
+        """Execute instructions ``pc:stop`` against ``mem`` and return the new pc.
+
+        The program comes as four ``int64`` operand columns and ``mem`` is a
+        ``uint64`` array already large enough for every destination address;
+        reads past its end yield zero like the sparse memory does.
+        """
+
+        size = np.uint64(mem.shape[0])
+        zero = np.uint64(0)
+        mask = np.uint64(0xFFFFFFFFFFFFFFFF)
+        while pc < stop:
+            opcode = opcodes[pc]
+            b = bs[pc]
+            c = cs[pc]
+            if opcode == 17:
+                mem[c] = np.uint64(b)
+            elif opcode == 23:
+                mem[c] = mem[b] if b < mem.shape[0] else zero
+            else:
+                base = mem[b] if b < mem.shape[0] else zero
+                value = zero
+                if base < size:
+                    address = base + np.uint64(c)
+                    if address < size:
+                        value = mem[address]
+                if opcode == 24:
+                    value = value ^ mask
+                mem[ds[pc]] = value
+            pc += 1
+        return pc
+
+    def run(opcodes, bs, cs, ds, cells, pc, stop):
+        """Same contract as ``uvm._fastvm.run``, for ``Program`` and ``Memory`` arrays."""
+
+        return run_vm(
+            *(np.frombuffer(column, dtype=np.int64) for column in (opcodes, bs, cs, ds)),
+            np.frombuffer(cells, dtype=np.uint64),
+            pc,
+            stop,
+        )
@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+"""Optional NumPy bulk decoder for program binaries.
+
+``decode_columns`` is ``None`` when NumPy is not installed; ``load_program``
+then decodes instruction by instruction.
+"""
+
+from .spec import INSTRUCTION_BYTES, OPCODE_BITS, OPERAND_NAMES, OPCODE_TABLE
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+    decode_columns = None
+else:
+    _KNOWN = np.array([definition is not None for definition in OPCODE_TABLE])
+    # Per-opcode (shift, mask) lookup tables for each operand. Absent fields
+    # get a zero mask; their shift is set to 1 so the ``64 - shift`` below
+    # never becomes a full-width shift.
+    _SHIFTS = []
+    _MASKS = []
+    for _operand in range(len(OPERAND_NAMES)):
+        _pairs = [
+            definition.operand_table[_operand] if definition is not None else (0, 0)
+            for definition in OPCODE_TABLE
+        ]
+        _SHIFTS.append(
+            np.array([shift if mask else 1 for shift, mask in _pairs], dtype=np.uint64)
+        )
+        _MASKS.append(np.array([mask for _, mask in _pairs], dtype=np.uint64))
+    del _operand, _pairs
+
+    def decode_columns(data) -> tuple:
+        """Decode a whole binary into ``(opcode, B, C, D)`` ``int64`` columns.
+
+        Each 14-byte row is zero-padded to 16 bytes and viewed as two
+        little-endian ``uint64`` halves. Every field then comes out of one
+        vectorised ``((low >> s) | (high << (64 - s))) & mask`` pass over the
+        whole program, which also covers fields crossing the 64-bit boundary.
+        """
+
+        count = len(data) // INSTRUCTION_BYTES
+        padded = np.zeros((count, 16), dtype=np.uint8)
+        padded[:, :INSTRUCTION_BYTES] = np.frombuffer(data, dtype=np.uint8).reshape(
+            count, INSTRUCTION_BYTES
+        )
+        halves = padded.view("<u8")
+        low = halves[:, 0]
+        high = halves[:, 1]
+        opcode = (low & np.uint64((1 << OPCODE_BITS) - 1)).astype(np.intp)
+        unknown = ~_KNOWN[opcode]
+        if unknown.any():
+            raise ValueError(f"Unknown opcode: {opcode[unknown.argmax()]}")
+        columns = [opcode.astype(np.int64)]
+        for shifts, masks in zip(_SHIFTS, _MASKS):
+            shift = shifts[opcode]
+            value = ((low >> shift) | (high << (np.uint64(64) - shift))) & masks[opcode]
+            columns.append(value.astype(np.int64))
+        return tuple(columns)
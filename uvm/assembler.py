@@ -3,9 +3,8 @@ from __future__ import annotations
 """Assembler CLI helpers for the training VM."""
 
 import csv
-import io
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
 from .spec import INSTRUCTION_BYTES, InstructionIR, INSTRUCTION_SET, encode_words
 
@@ -14,66 +13,164 @@ HEADER_CANDIDATES = {"OPCODE", "MNEMONIC"}
 FIELD_SKIP = HEADER_CANDIDATES | {"", None}
 
 
-def _read_clean_lines(path: Path) -> List[str]:
-    raw = path.read_text(encoding="utf-8").splitlines()
-    cleaned: List[str] = []
-    for line in raw:
+def _iter_clean_lines(handle: Iterable[str]) -> Iterator[str]:
+    for line in handle:
         stripped = line.strip()
         if not stripped:
             continue
         if stripped.startswith(COMMENT_PREFIX):
             continue
-        cleaned.append(line)
-    return cleaned
+        yield line
 
 
-def parse_source(path: Path) -> List[InstructionIR]:
-    """Parse CSV source into a list of IR instructions."""
+def _read_header(reader: Iterator[List[str]]) -> Optional[Tuple[int, Dict[str, int]]]:
+    """Consume the header row and return the opcode and field column indices.
+
+    Column positions are resolved once so rows can be read by index instead
+    of building a dict per row. Returns ``None`` for an empty source.
+    """
 
-    lines = _read_clean_lines(path)
-    if not lines:
-        return []
-    buffer = io.StringIO("\n".join(lines))
-    reader = csv.DictReader(buffer)
-    if not reader.fieldnames:
+    header = next(reader, None)
+    if header is None:
+        return None
+    if not header:
         raise ValueError("CSV file must contain a header row")
 
-    fieldnames = [name.strip().upper() if name else "" for name in reader.fieldnames]
+    fieldnames = [name.strip().upper() for name in header]
     if not any(name in HEADER_CANDIDATES for name in fieldnames):
         raise ValueError("Header must contain an 'opcode' column")
-
-    instructions: List[InstructionIR] = []
-    for row in reader:
-        if not row:
-            continue
-        mnemonic_raw = None
-        fields = {}
-        for original_key, value in row.items():
-            key = (original_key or "").strip().upper()
-            if key in HEADER_CANDIDATES:
-                mnemonic_raw = (value or "").strip()
+    mnemonic_idx = 0
+    field_columns: Dict[str, int] = {}
+    for idx, name in enumerate(fieldnames):
+        if name in HEADER_CANDIDATES:
+            mnemonic_idx = idx
+        elif name not in FIELD_SKIP:
+            field_columns[name] = idx
+    return mnemonic_idx, field_columns
+
+
+def _parse_row(
+    row: List[str], mnemonic_idx: int, field_columns: Dict[str, int], line_num: int
+) -> InstructionIR:
+    width = len(row)
+    mnemonic_raw = row[mnemonic_idx].strip() if mnemonic_idx < width else ""
+    fields = {}
+    # One handler per row rather than per field; key/value_str still name the
+    # offending cell when int() fails.
+    try:
+        for key, idx in field_columns.items():
+            if idx >= width:
                 continue
-            if key in FIELD_SKIP:
+            value_str = row[idx].strip()
+            if not value_str:
                 continue
-            if value is None:
+            fields[key] = int(value_str, 0)
+    except ValueError as exc:
+        raise ValueError(
+            f"Failed to parse integer for field '{key}': {value_str}"
+        ) from exc
+    mnemonic = mnemonic_raw.upper()
+    if mnemonic not in INSTRUCTION_SET:
+        raise ValueError(f"Unknown mnemonic '{mnemonic}' on row {line_num}")
+    return InstructionIR(mnemonic=mnemonic, fields=fields)
+
+
+def parse_source(path: Path) -> List[InstructionIR]:
+    """Parse CSV source into a list of IR instructions."""
+
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        reader = csv.reader(_iter_clean_lines(handle))
+        layout = _read_header(reader)
+        if layout is None:
+            return []
+        mnemonic_idx, field_columns = layout
+        return [
+            _parse_row(row, mnemonic_idx, field_columns, reader.line_num)
+            for row in reader
+            if row
+        ]
+
+
+def encode_source(path: Path) -> Iterator[int]:
+    """Assemble CSV source straight into machine words, yielding them lazily.
+
+    Equivalent to ``iter(encode_words(parse_source(path)))`` but each row is
+    encoded as soon as it is read, without building IR objects. Rows that
+    fail any fast-path check go through the IR path, which either encodes
+    them or raises the usual error. As in the two-pass pipeline, a parse
+    error anywhere in the file wins over an encoding error on an earlier row.
+    """
+
+    with path.open("r", encoding="utf-8", newline="") as handle:
+        reader = csv.reader(_iter_clean_lines(handle))
+        layout = _read_header(reader)
+        if layout is None:
+            return
+        mnemonic_idx, field_columns = layout
+        # Per instruction: columns that must stay empty, and the column of
+        # each declared field in ``encode_table`` order (-1 if missing).
+        foreign_columns = {}
+        declared_columns = {}
+        for mnemonic, definition in INSTRUCTION_SET.items():
+            names = [name for name, _, _, _ in definition.encode_table]
+            foreign_columns[mnemonic] = [
+                idx for key, idx in field_columns.items() if key not in names
+            ]
+            declared_columns[mnemonic] = tuple(field_columns.get(name, -1) for name in names)
+
+        pending: Optional[ValueError] = None
+        for row in reader:
+            if not row:
                 continue
-            value_str = value.strip()
+            word = _encode_row(row, mnemonic_idx, foreign_columns, declared_columns)
+            if word is None:
+                ir = _parse_row(row, mnemonic_idx, field_columns, reader.line_num)
+                try:
+                    word = encode_words([ir])[0]
+                except ValueError as exc:
+                    # Keep scanning: later rows may still fail to parse.
+                    if pending is None:
+                        pending = exc
+                    continue
+            if pending is None:
+                yield word
+        if pending is not None:
+            raise pending
+
+
+def _encode_row(
+    row: List[str],
+    mnemonic_idx: int,
+    foreign_columns: Dict[str, List[int]],
+    declared_columns: Dict[str, Tuple[int, ...]],
+) -> Optional[int]:
+    """Encode a well-formed row directly; return ``None`` if anything is off."""
+
+    width = len(row)
+    mnemonic = (row[mnemonic_idx].strip() if mnemonic_idx < width else "").upper()
+    definition = INSTRUCTION_SET.get(mnemonic)
+    if definition is None:
+        return None
+    for idx in foreign_columns[mnemonic]:
+        if idx < width and row[idx].strip():
+            return None
+    encoded = definition.opcode
+    try:
+        for idx, (_, shift, mask, _) in zip(
+            declared_columns[mnemonic], definition.encode_table
+        ):
+            if idx < 0 or idx >= width:
+                return None
+            value_str = row[idx].strip()
             if not value_str:
-                continue
-            try:
-                parsed_value = int(value_str, 0)
-            except ValueError as exc:
-                raise ValueError(
-                    f"Failed to parse integer for field '{key}': {value_str}"
-                ) from exc
-            fields[key] = parsed_value
-        if mnemonic_raw is None:
-            raise ValueError("Each row must include an opcode column")
-        mnemonic = mnemonic_raw.upper()
-        if mnemonic not in INSTRUCTION_SET:
-            raise ValueError(f"Unknown mnemonic '{mnemonic}' on row {reader.line_num}")
-        instructions.append(InstructionIR(mnemonic=mnemonic, fields=fields))
-    return instructions
+                return None
+            value = int(value_str, 0)
+            if value < 0 or value > mask:
+                return None
+            encoded |= value << shift
+    except ValueError:
+        return None
+    return encoded
 
 
 def format_ir_dump(ir_list: Iterable[InstructionIR]) -> str:
@@ -101,15 +198,21 @@ def format_byte_dump(blob: bytes, columns: int = 8) -> str:
 def assemble_to_file(source: Path, output: Path, test_mode: bool = False) -> bytes:
     """Assemble the provided CSV source file and persist the binary output."""
 
-    instructions = parse_source(source)
     if test_mode:
+        instructions = parse_source(source)
         print(format_ir_dump(instructions))
-    words = encode_words(instructions)
-    blob = b"".join(word.to_bytes(INSTRUCTION_BYTES, "little") for word in words)
+        words = encode_words(instructions)
+    else:
+        words = encode_source(source)
+    # Serialise while the words are produced into one growing buffer: no list
+    # of ints, and unlike b"".join no list of per-word bytes objects either.
+    buffer = bytearray()
+    for word in words:
+        buffer += word.to_bytes(INSTRUCTION_BYTES, "little")
     output.parent.mkdir(parents=True, exist_ok=True)
-    output.write_bytes(blob)
-    print(f"Assembled instructions: {len(words)}")
-    if test_mode and blob:
+    output.write_bytes(buffer)
+    print(f"Assembled instructions: {len(buffer) // INSTRUCTION_BYTES}")
+    if test_mode and buffer:
         print("Byte dump:")
-        print(format_byte_dump(blob))
-    return blob
\ No newline at end of file
+        print(format_byte_dump(buffer))
+    return bytes(buffer)
\ No newline at end of file
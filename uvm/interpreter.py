@@ -2,39 +2,133 @@ from __future__ import annotations
 
 """Interpreter helpers for the training VM."""
 
+from array import array
 from dataclasses import dataclass
+from itertools import chain
+import mmap
+import os
 from pathlib import Path
-from typing import Dict, Iterable, List, Optional, Tuple
-import xml.etree.ElementTree as ET
+import stat
+import struct
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+from . import _vector
 from .spec import (
     INSTRUCTION_BYTES,
-    MachineInstruction,
+    INSTRUCTION_SET,
+    OPCODE_BITS,
     WORD_MASK,
-    decode_word,
+    Program,
+    decode_operands,
 )
 
+try:
+    from . import _fastvm
+except ImportError:  # extension not built, see setup.py
+    _fastvm = None
+
+# A 14-byte instruction split into 64 + 32 + 16 bit little-endian chunks, so the
+# whole binary can be unpacked in a single C-level pass.
+_WORD_LAYOUT = struct.Struct("<QIH")
+
+OP_LOAD_CONST = INSTRUCTION_SET["LOAD_CONST"].opcode
+OP_READ_MEM = INSTRUCTION_SET["READ_MEM"].opcode
+OP_WRITE_MEM = INSTRUCTION_SET["WRITE_MEM"].opcode
+OP_NOT_MEM = INSTRUCTION_SET["NOT_MEM"].opcode
+
+# Superinstructions produced by fuse_program. They live outside the 5-bit
+# opcode space, so they can never collide with a decoded instruction. Each one
+# replaces the first instruction of a pair whose second half is WRITE_MEM
+# copying the value the first one just stored. Only compile_program fuses:
+# the extra pass over the program pays off only for code that runs many times.
+OP_LOAD_STORE = (1 << OPCODE_BITS) + 0  # LOAD_CONST + WRITE_MEM
+OP_READ_STORE = (1 << OPCODE_BITS) + 1  # READ_MEM + WRITE_MEM
+OP_NOT_STORE = (1 << OPCODE_BITS) + 2  # NOT_MEM + WRITE_MEM
+
+_FUSIONS = {
+    (OP_LOAD_CONST, OP_WRITE_MEM): OP_LOAD_STORE,
+    (OP_READ_MEM, OP_WRITE_MEM): OP_READ_STORE,
+    (OP_NOT_MEM, OP_WRITE_MEM): OP_NOT_STORE,
+}
+
+# Opcodes whose destination address is operand C, and those where it is D.
+# Every destination is static, so the native loops can size memory up front.
+_C_DESTINATION = frozenset((OP_LOAD_CONST, OP_WRITE_MEM))
+_D_DESTINATION = frozenset((OP_READ_MEM, OP_NOT_MEM))
+
+
+# Importing Numba and loading its cached kernel costs about 0.2 s per process,
+# as much as the Python loop spends on ~700k instructions; shorter runs never
+# import it.
+_JIT_THRESHOLD = 1 << 20
+
+
+# Addresses below this limit live in a flat array (8 MiB at most); anything
+# higher falls back to a dict so a single far write cannot allocate gigabytes.
+DENSE_LIMIT = 1 << 20
+
 
 class Memory:
-    """Sparse memory model shared by the interpreter."""
+    """Memory model shared by the interpreter.
+
+    Low addresses are stored densely in an ``array('Q')`` that grows on
+    demand; addresses at or above ``DENSE_LIMIT`` are kept sparsely.
+    """
 
     def __init__(self) -> None:
-        self._cells: Dict[int, int] = {}
+        self._cells = array("Q")
+        self._sparse: Dict[int, int] = {}
 
     def read(self, address: int) -> int:
         if address < 0:
             raise ValueError("Address must be non-negative")
-        return self._cells.get(address, 0)
+        if address < len(self._cells):
+            return self._cells[address]
+        return self._sparse.get(address, 0)
 
     def write(self, address: int, value: int) -> None:
         if address < 0:
             raise ValueError("Address must be non-negative")
-        self._cells[address] = value & WORD_MASK
+        cells = self._cells
+        if address >= len(cells):
+            if address >= DENSE_LIMIT:
+                self._sparse[address] = value & WORD_MASK
+                return
+            self._grow(address)
+        try:
+            cells[address] = value
+        except OverflowError:
+            # Negative or wider than 64 bits: wrap to the VM word size. The
+            # unsigned array truncation makes the mask redundant otherwise.
+            cells[address] = value & WORD_MASK
+
+    def reserve(self, address: int) -> None:
+        """Make sure ``address`` is backed by the dense array."""
+
+        if address >= DENSE_LIMIT:
+            raise ValueError(f"Address {address} is outside the dense range")
+        if address >= len(self._cells):
+            self._grow(address)
+
+    def _grow(self, address: int) -> None:
+        size = len(self._cells)
+        new_size = min(DENSE_LIMIT, max(address + 1, size * 2))
+        self._cells.frombytes(bytes((new_size - size) * self._cells.itemsize))
+
+    def dump(self, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        """Iterate ``(address, value)`` pairs for the inclusive range.
+
+        The range is validated eagerly; values come lazily from a slice of
+        the dense array followed by the sparse cells above it.
+        """
 
-    def dump(self, start: int, end: int) -> List[Tuple[int, int]]:
         if start < 0 or end < 0 or end < start:
             raise ValueError("Invalid dump range")
-        return [(addr, self.read(addr)) for addr in range(start, end + 1)]
+        dense = self._cells[start : end + 1]
+        sparse = (
+            self._sparse.get(addr, 0) for addr in range(start + len(dense), end + 1)
+        )
+        return zip(range(start, end + 1), chain(dense, sparse))
 
 
 @dataclass
@@ -44,83 +138,291 @@ class ExecutionResult:
 
 
 class Interpreter:
-    def __init__(self, program: List[MachineInstruction], memory: Optional[Memory] = None):
+    def __init__(self, program: Program, memory: Optional[Memory] = None):
         self.program = program
         self.memory = memory or Memory()
         self.pc = 0
         self.steps = 0
 
     def run(self, max_steps: Optional[int] = None) -> ExecutionResult:
-        while self.pc < len(self.program):
-            if max_steps is not None and self.steps >= max_steps:
-                return ExecutionResult(steps=self.steps, halted=False)
-            self._execute(self.program[self.pc])
-            self.pc += 1
-            self.steps += 1
-        return ExecutionResult(steps=self.steps, halted=True)
-
-    def _execute(self, instruction: MachineInstruction) -> None:
-        name = instruction.definition.mnemonic
-        fields = instruction.fields
-        if name == "LOAD_CONST":
-            self._op_load_const(fields)
-        elif name == "READ_MEM":
-            self._op_read_mem(fields)
-        elif name == "WRITE_MEM":
-            self._op_write_mem(fields)
-        elif name == "NOT_MEM":
-            self._op_not_mem(fields)
+        native = _native_loop(self._stop(max_steps) - self.pc)
+        if native is not None and self._prepare_native():
+            return self._run_native(native, max_steps)
+        program = self.program
+        stop = self._stop(max_steps)
+        read = self.memory.read
+        write = self.memory.write
+        pc = self.pc
+        rows = zip(
+            program.opcode[pc:stop], program.b[pc:stop], program.c[pc:stop], program.d[pc:stop]
+        )
+        try:
+            for opcode, b, c, d in rows:
+                if opcode == OP_LOAD_CONST:
+                    write(c, b)
+                elif opcode == OP_READ_MEM:
+                    write(d, read(read(b) + c))
+                elif opcode == OP_WRITE_MEM:
+                    write(c, read(b))
+                elif opcode == OP_NOT_MEM:
+                    write(d, read(read(b) + c) ^ WORD_MASK)
+                else:
+                    raise ValueError(f"Unsupported opcode: {opcode}")
+                pc += 1
+        finally:
+            self.steps += pc - self.pc
+            self.pc = pc
+        return ExecutionResult(steps=self.steps, halted=self.pc >= len(program))
+
+    def _stop(self, max_steps: Optional[int]) -> int:
+        """Return the pc at which the current run has to stop."""
+
+        stop = len(self.program)
+        if max_steps is not None:
+            stop = min(stop, self.pc + max(0, max_steps - self.steps))
+        return stop
+
+    def _prepare_native(self) -> bool:
+        """Reserve memory for every destination the native loop will write.
+
+        Returns ``False`` when the program writes outside the dense memory
+        range, contains an opcode the native loops do not implement, or
+        memory already holds sparse cells, which the native loop cannot see;
+        the Python loop is used in that case (and raises for bad opcodes).
+        """
+
+        if self.memory._sparse:
+            return False
+        highest = _highest_destination(self.program)
+        if highest >= DENSE_LIMIT:
+            return False
+        if highest >= 0:
+            self.memory.reserve(highest)
+        return True
+
+    def _run_native(self, loop: Callable[..., int], max_steps: Optional[int]) -> ExecutionResult:
+        """Run the decoded program with a native loop from ``_native_loop``."""
+
+        program = self.program
+        stop = self._stop(max_steps)
+        columns = (program.opcode, program.b, program.c, program.d)
+        pc = loop(*columns, self.memory._cells, self.pc, stop)
+        self.steps += pc - self.pc
+        self.pc = pc
+        return ExecutionResult(steps=self.steps, halted=self.pc >= len(self.program))
+
+
+def _native_loop(count: int) -> Optional[Callable[..., int]]:
+    """Pick the native loop for a run of ``count`` instructions, if any.
+
+    The C extension has no start-up cost and is always preferred. Numba is
+    imported only for runs of at least ``_JIT_THRESHOLD`` instructions.
+    """
+
+    if _fastvm is not None:
+        return _fastvm.run
+    if count >= _JIT_THRESHOLD:
+        from . import _jit
+
+        return _jit.run
+    return None
+
+
+def _highest_destination(program: Program) -> int:
+    """Return the highest address ``program`` writes, ``-1`` if it writes none.
+
+    Returns ``DENSE_LIMIT`` when the program contains an opcode without a
+    known destination operand. The C extension does this in one pass when
+    it is built; otherwise whole columns are scanned, with NumPy masks when
+    it is installed. The pure Python fallback takes the maximum of D over
+    every row, since operands an instruction does not have decode as zero.
+    C is also the offset of READ_MEM/NOT_MEM, so its maximum is only an
+    upper bound, and the rows are filtered only when it would leave the
+    dense range.
+    """
+
+    if _fastvm is not None:
+        return _fastvm.highest_destination(program.opcode, program.c, program.d, DENSE_LIMIT)
+    np = _vector.np
+    if np is not None:
+        opcodes = np.frombuffer(program.opcode, dtype=np.int64)
+        writes_c = (opcodes == OP_LOAD_CONST) | (opcodes == OP_WRITE_MEM)
+        writes_d = (opcodes == OP_READ_MEM) | (opcodes == OP_NOT_MEM)
+        if not (writes_c | writes_d).all():
+            return DENSE_LIMIT
+        highest_c = np.frombuffer(program.c, dtype=np.int64)[writes_c].max(initial=-1)
+        highest_d = np.frombuffer(program.d, dtype=np.int64)[writes_d].max(initial=-1)
+        return int(max(highest_c, highest_d))
+
+    opcodes = set(program.opcode)
+    if not opcodes <= _C_DESTINATION | _D_DESTINATION:
+        return DENSE_LIMIT
+    highest_c = max(program.c, default=-1)
+    if highest_c >= DENSE_LIMIT and opcodes & _D_DESTINATION:
+        highest_c = max(
+            (c for opcode, c in zip(program.opcode, program.c) if opcode in _C_DESTINATION),
+            default=-1,
+        )
+    return max(highest_c, max(program.d, default=-1))
+
+
+def fuse_program(program: Program) -> Program:
+    """Rewrite fusible instruction pairs into superinstructions.
+
+    A pair is fused when its opcodes appear in ``_FUSIONS`` and the WRITE_MEM
+    reads the address the first instruction wrote. Only the first slot is
+    replaced: the result has the same length as ``program`` and the second
+    slot keeps the original WRITE_MEM, which the superinstruction consumes.
+    ``program`` itself is returned when nothing fuses.
+    """
+
+    opcodes, bs, cs, ds = program.opcode, program.b, program.c, program.d
+    code: Optional[Program] = None
+    # Every fusion ends in WRITE_MEM and WRITE_MEM never starts one, so
+    # candidate pairs cannot overlap and each can be checked independently.
+    for idx, pair in enumerate(zip(opcodes, opcodes[1:])):
+        fused = _FUSIONS.get(pair)
+        if fused is None:
+            continue
+        destination = cs[idx] if fused == OP_LOAD_STORE else ds[idx]
+        if bs[idx + 1] != destination:
+            continue
+        if code is None:
+            code = program.copy()
+        code.opcode[idx] = fused
+        if fused == OP_LOAD_STORE:
+            code.d[idx] = cs[idx + 1]
+    return program if code is None else code
+
+
+# Instructions per generated function in compile_program; keeps each code
+# object a reasonable size for very long programs.
+_COMPILE_BLOCK = 1024
+
+
+def _compile_statements(code: Program) -> List[str]:
+    statements: List[str] = []
+    rows = iter(code)
+    for opcode, b, c, d in rows:
+        if opcode == OP_LOAD_CONST:
+            statements.append(f"write({c}, {b})")
+        elif opcode == OP_READ_MEM:
+            statements.append(f"write({d}, read(read({b}) + {c}))")
+        elif opcode == OP_WRITE_MEM:
+            statements.append(f"write({c}, read({b}))")
+        elif opcode == OP_NOT_MEM:
+            statements.append(f"write({d}, read(read({b}) + {c}) ^ WORD_MASK)")
+        elif opcode == OP_LOAD_STORE:
+            next(rows)
+            statements.append(f"write({c}, {b}); write({d}, {b})")
+        elif opcode == OP_READ_STORE:
+            target = next(rows)[2]
+            statements.append(
+                f"value = read(read({b}) + {c}); write({d}, value); write({target}, value)"
+            )
+        elif opcode == OP_NOT_STORE:
+            target = next(rows)[2]
+            statements.append(
+                f"value = read(read({b}) + {c}) ^ WORD_MASK; "
+                f"write({d}, value); write({target}, value)"
+            )
         else:
-            raise ValueError(f"Unsupported instruction: {name}")
-
-    def _op_load_const(self, fields: Dict[str, int]) -> None:
-        constant = fields["B"]
-        destination = fields["C"]
-        self.memory.write(destination, constant)
-
-    def _op_read_mem(self, fields: Dict[str, int]) -> None:
-        pointer_address = fields["B"]
-        offset = fields["C"]
-        target_address = fields["D"]
-        base = self.memory.read(pointer_address)
-        value = self.memory.read(base + offset)
-        self.memory.write(target_address, value)
-
-    def _op_write_mem(self, fields: Dict[str, int]) -> None:
-        source_address = fields["B"]
-        destination_address = fields["C"]
-        value = self.memory.read(source_address)
-        self.memory.write(destination_address, value)
-
-    def _op_not_mem(self, fields: Dict[str, int]) -> None:
-        pointer_address = fields["B"]
-        offset = fields["C"]
-        target_address = fields["D"]
-        base = self.memory.read(pointer_address)
-        value = self.memory.read(base + offset)
-        self.memory.write(target_address, (~value) & WORD_MASK)
-
-
-def load_program(path: Path) -> List[MachineInstruction]:
-    data = path.read_bytes()
+            raise ValueError(f"Unsupported opcode: {opcode}")
+    return statements
+
+
+def compile_program(program: Program) -> Callable[[Memory, Optional[int]], ExecutionResult]:
+    """Specialise ``program`` into straight-line Python code.
+
+    None of the instructions branch, so the whole program becomes a sequence
+    of ``memory.read``/``memory.write`` calls with every operand inlined as a
+    literal; running it has no dispatch loop at all. This pays off for
+    programs that are executed many times. The returned function takes a
+    memory and an optional step cap; runs cut short by ``max_steps`` go
+    through the regular interpreter.
+    """
+
+    statements = _compile_statements(fuse_program(program))
+    lines: List[str] = []
+    blocks: List[str] = []
+    for index in range(0, len(statements), _COMPILE_BLOCK):
+        name = f"_block{len(blocks)}"
+        blocks.append(name)
+        lines.append(f"def {name}(read, write):")
+        lines.extend(f"    {statement}" for statement in statements[index : index + _COMPILE_BLOCK])
+    namespace = {"WORD_MASK": WORD_MASK}
+    exec(compile("\n".join(lines), "<uvm-program>", "exec"), namespace)
+    compiled = [namespace[name] for name in blocks]
+    length = len(program)
+
+    def run(memory: Memory, max_steps: Optional[int] = None) -> ExecutionResult:
+        if max_steps is not None and max_steps < length:
+            return Interpreter(program, memory).run(max_steps=max_steps)
+        read = memory.read
+        write = memory.write
+        for block in compiled:
+            block(read, write)
+        return ExecutionResult(steps=length, halted=True)
+
+    return run
+
+
+def load_program(path: Path) -> Program:
+    with path.open("rb") as handle:
+        info = os.fstat(handle.fileno())
+        if not stat.S_ISREG(info.st_mode):
+            # Pipes and devices have no meaningful size and cannot be mapped.
+            return _decode_program(handle.read())
+        if info.st_size == 0:
+            # Empty files cannot be mapped.
+            return Program()
+        # Decode straight from a read-only mapping instead of copying the whole
+        # file into a bytes object first.
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return _decode_program(data)
+
+
+def _decode_program(data) -> Program:
+    """Decode a whole binary image held in any buffer (bytes or mmap)."""
+
     if len(data) % INSTRUCTION_BYTES != 0:
         raise ValueError("Binary file size must be a multiple of 14 bytes")
-    program: List[MachineInstruction] = []
-    for idx in range(0, len(data), INSTRUCTION_BYTES):
-        chunk = data[idx : idx + INSTRUCTION_BYTES]
-        word = int.from_bytes(chunk, "little")
-        program.append(decode_word(word))
+    if not data:
+        return Program()
+    if _vector.decode_columns is not None:
+        columns = []
+        for column in _vector.decode_columns(data):
+            # A single copy straight out of the ndarray's buffer; frombytes
+            # only takes byte-formatted buffers, hence the zero-copy cast.
+            values = array("q")
+            values.frombytes(memoryview(column).cast("B"))
+            columns.append(values)
+        return Program(*columns)
+    program = Program()
+    append = program.append
+    words = _WORD_LAYOUT.iter_unpack(data)
+    try:
+        for low, middle, high in words:
+            append(decode_operands(low | (middle << 64) | (high << 96)))
+    finally:
+        # The iterator pins the buffer; drop it so a mapping can be closed
+        # even when decoding fails.
+        del words
     return program
 
 
 def dump_memory_to_xml(memory: Memory, start: int, end: int, output: Path) -> None:
     dump = memory.dump(start, end)
-    root = ET.Element("memory", attrib={"start": str(start), "end": str(end)})
-    for address, value in dump:
-        ET.SubElement(root, "cell", address=str(address), value=str(value))
-    tree = ET.ElementTree(root)
     output.parent.mkdir(parents=True, exist_ok=True)
-    tree.write(output, encoding="utf-8", xml_declaration=True)
+    # Streamed cell by cell rather than built as an ElementTree. Only integers
+    # are written, so nothing needs escaping; the layout matches ET's output.
+    with output.open("w", encoding="utf-8", newline="\n") as handle:
+        handle.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        handle.write(f'<memory start="{start}" end="{end}">')
+        handle.writelines(
+            f'<cell address="{address}" value="{value}" />' for address, value in dump
+        )
+        handle.write("</memory>")
 
 
 def interpret(binary: Path, dump_path: Path, start: int, end: int, max_steps: Optional[int] = None) -> ExecutionResult:
@@ -2,14 +2,20 @@ from __future__ import annotations
 
 """Instruction set and core data models for the training VM."""
 
-from dataclasses import dataclass
-from typing import Dict, Iterable, Mapping
+from array import array
+from dataclasses import dataclass, field as dataclass_field
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
 
 INSTRUCTION_BITS = 112
 INSTRUCTION_BYTES = 14
 OPCODE_BITS = 5
 WORD_SIZE = 64
 WORD_MASK = (1 << WORD_SIZE) - 1
+OPERAND_NAMES = ("B", "C", "D")
+
+# Flat ``(opcode, B, C, D)`` form of a decoded instruction; unused fields are 0.
+DecodedInstruction = Tuple[int, int, int, int]
 
 
 @dataclass(frozen=True)
@@ -36,9 +42,52 @@ class InstructionDefinition:
     mnemonic: str
     opcode: int
     fields: tuple[FieldDefinition, ...]
+    # (name, shift, mask) per field, precomputed so the codec loops avoid
+    # re-evaluating the FieldDefinition properties on every call.
+    _decode_table: tuple[tuple[str, int, int], ...] = dataclass_field(
+        init=False, repr=False, compare=False
+    )
+    # Public field layout, shared with the assembler's direct encoder:
+    # (name, shift, mask, width) per field; width is kept for error messages.
+    encode_table: tuple[tuple[str, int, int, int], ...] = dataclass_field(
+        init=False, repr=False, compare=False
+    )
+    _required: frozenset[str] = dataclass_field(init=False, repr=False, compare=False)
+    # Public operand layout, shared with the NumPy decoder: (shift, mask) for
+    # B, C and D in that order; absent fields get a zero mask.
+    operand_table: tuple[tuple[int, int], ...] = dataclass_field(
+        init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self) -> None:
+        object.__setattr__(
+            self,
+            "_decode_table",
+            tuple((field.name, field.start_bit, field.mask) for field in self.fields),
+        )
+        object.__setattr__(
+            self,
+            "encode_table",
+            tuple(
+                (field.name.upper(), field.start_bit, field.mask, field.width)
+                for field in self.fields
+            ),
+        )
+        object.__setattr__(self, "_required", frozenset(field.name for field in self.fields))
+        by_name = {field.name: field for field in self.fields}
+        object.__setattr__(
+            self,
+            "operand_table",
+            tuple(
+                (by_name[name].start_bit, by_name[name].mask) if name in by_name else (0, 0)
+                for name in OPERAND_NAMES
+            ),
+        )
 
     def validate_fields(self, values: Mapping[str, int]) -> None:
-        required = {field.name for field in self.fields}
+        required = self._required
+        if values.keys() == required:
+            return
         missing = required - {name.upper() for name in values}
         if missing:
             raise ValueError(
@@ -56,23 +105,19 @@ class InstructionDefinition:
 
         self.validate_fields(values)
         encoded = self.opcode & ((1 << OPCODE_BITS) - 1)
-        for field in self.fields:
-            raw_value = int(values[field.name.upper()])
-            if raw_value < 0 or raw_value > field.mask:
+        for name, shift, mask, width in self.encode_table:
+            raw_value = int(values[name])
+            if raw_value < 0 or raw_value > mask:
                 raise ValueError(
-                    f"Field '{field.name}'={raw_value} does not fit into {field.width} bits"
+                    f"Field '{name}'={raw_value} does not fit into {width} bits"
                 )
-            encoded |= raw_value << field.start_bit
+            encoded |= raw_value << shift
         return encoded
 
     def extract_fields(self, encoded: int) -> Dict[str, int]:
         """Extract field values from a raw instruction word."""
 
-        result: Dict[str, int] = {}
-        for field in self.fields:
-            value = (encoded >> field.start_bit) & field.mask
-            result[field.name] = value
-        return result
+        return {name: (encoded >> shift) & mask for name, shift, mask in self._decode_table}
 
 
 @dataclass
@@ -92,6 +137,45 @@ class MachineInstruction:
     raw_value: int
 
 
+def _column() -> array:
+    return array("q")
+
+
+@dataclass
+class Program:
+    """Decoded program stored column-wise, one array per operand.
+
+    Columns are signed 64-bit ``array`` objects (every field fits easily), so
+    compiled loops can view them without copying. Unused fields are 0.
+    """
+
+    opcode: array = dataclass_field(default_factory=_column)
+    b: array = dataclass_field(default_factory=_column)
+    c: array = dataclass_field(default_factory=_column)
+    d: array = dataclass_field(default_factory=_column)
+
+    def append(self, row: DecodedInstruction) -> None:
+        opcode, b, c, d = row
+        self.opcode.append(opcode)
+        self.b.append(b)
+        self.c.append(c)
+        self.d.append(d)
+
+    def copy(self) -> "Program":
+        return Program(
+            array("q", self.opcode), array("q", self.b), array("q", self.c), array("q", self.d)
+        )
+
+    def __len__(self) -> int:
+        return len(self.opcode)
+
+    def __getitem__(self, index: int) -> DecodedInstruction:
+        return (self.opcode[index], self.b[index], self.c[index], self.d[index])
+
+    def __iter__(self) -> Iterator[DecodedInstruction]:
+        return zip(self.opcode, self.b, self.c, self.d)
+
+
 FIELD_B_SHORT = FieldDefinition("B", 5, 21)  # 17 bits
 FIELD_C_LONG = FieldDefinition("C", 22, 50)  # 29 bits
 FIELD_B_LONG = FieldDefinition("B", 5, 33)   # 29 bits
@@ -127,18 +211,42 @@ INSTRUCTION_BY_OPCODE: Dict[int, InstructionDefinition] = {
     definition.opcode: definition for definition in INSTRUCTION_SET.values()
 }
 
+# Dense opcode -> definition list (``None`` for unknown opcodes): opcodes fit in
+# OPCODE_BITS, so decoders can index directly instead of hashing into
+# INSTRUCTION_BY_OPCODE.
+OPCODE_TABLE: List[Optional[InstructionDefinition]] = [None] * (1 << OPCODE_BITS)
+for _definition in INSTRUCTION_SET.values():
+    OPCODE_TABLE[_definition.opcode] = _definition
+del _definition
+
 
 def decode_word(word: int) -> MachineInstruction:
     """Turn a raw 112-bit word into a machine instruction."""
 
     opcode = word & ((1 << OPCODE_BITS) - 1)
-    definition = INSTRUCTION_BY_OPCODE.get(opcode)
+    definition = OPCODE_TABLE[opcode]
     if definition is None:
         raise ValueError(f"Unknown opcode: {opcode}")
     fields = definition.extract_fields(word)
     return MachineInstruction(definition=definition, fields=fields, raw_value=word)
 
 
+def decode_operands(word: int) -> DecodedInstruction:
+    """Turn a raw 112-bit word into an ``(opcode, B, C, D)`` tuple."""
+
+    opcode = word & ((1 << OPCODE_BITS) - 1)
+    definition = OPCODE_TABLE[opcode]
+    if definition is None:
+        raise ValueError(f"Unknown opcode: {opcode}")
+    (b_shift, b_mask), (c_shift, c_mask), (d_shift, d_mask) = definition.operand_table
+    return (
+        opcode,
+        (word >> b_shift) & b_mask,
+        (word >> c_shift) & c_mask,
+        (word >> d_shift) & d_mask,
+    )
+
+
 def encode_words(instructions: Iterable[InstructionIR]) -> list[int]:
     """Encode a sequence of IR instructions into machine words."""
 
@@ -147,5 +255,15 @@ def encode_words(instructions: Iterable[InstructionIR]) -> list[int]:
         definition = INSTRUCTION_SET.get(ir.mnemonic.upper())
         if definition is None:
             raise ValueError(f"Unknown instruction mnemonic: {ir.mnemonic}")
-        words.append(definition.encode(ir.fields))
-    return words
\ No newline at end of file
+        words.append(_encode_cached(definition.mnemonic, tuple(sorted(ir.fields.items()))))
+    return words
+
+
+@lru_cache(maxsize=4096)
+def _encode_cached(mnemonic: str, items: tuple[tuple[str, int], ...]) -> int:
+    """Encode an instruction from ``(field, value)`` pairs, memoised.
+
+    Repeated rows (e.g. long zero-init runs) skip validation and shifting.
+    """
+
+    return INSTRUCTION_SET[mnemonic].encode(dict(items))
\ No newline at end of file